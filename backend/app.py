@@ -1,11 +1,18 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from contextlib import AsyncExitStack
+from typing import List
+import zipfile
+import codecs
 import shutil
 import os
 from services.stego import StegoService
 from services.audio_stego import AudioStegoService
-from services.analysis import SteganalysisService
+from services.analysis import SteganalysisService, ANALYSIS_MODES
+from services.sharding import ShardingService, ShardCapacityError, ShardSetError, AUDIO_EXTENSIONS
+from services.admission import AdmissionController, AdmissionRejected, estimate_image_bytes, estimate_audio_bytes
 from PIL import Image
 import io
 import uuid
@@ -34,6 +41,7 @@ app.add_middleware(
 stego_service = StegoService()
 audio_stego_service = AudioStegoService()
 analysis_service = SteganalysisService()
+sharding_service = ShardingService(stego_service, audio_stego_service)
 
 TMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tmp_uploads")
 os.makedirs(TMP_DIR, exist_ok=True)
@@ -42,6 +50,18 @@ def get_tmp_path(filename: str) -> str:
     os.makedirs(TMP_DIR, exist_ok=True)
     return os.path.join(TMP_DIR, filename)
 
+def open_image(image_bytes: bytes) -> Image.Image:
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    # convert() copies even when the mode already matches
+    img.load()
+    return img
+
+def copy_upload(upload: UploadFile, path: str):
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(upload.file, buffer)
+
 def safe_remove(path: str):
     try:
         if os.path.exists(path):
@@ -56,6 +76,44 @@ def read_root():
 MAX_FILE_SIZE_STEGANOGRAPHY = 100 * 1024 * 1024 # 100MB
 MAX_FILE_SIZE_STEGANALYSIS = 300 * 1024 * 1024 # 300MB
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# Admission control: per-process memory budget and bounded wait queue
+admission = AdmissionController(
+    budget_bytes=int(os.getenv("ADMISSION_MEMORY_BUDGET_MB", "2048")) * 1024 * 1024,
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "16")),
+    small_request_bytes=int(os.getenv("ADMISSION_SMALL_REQUEST_MB", "64")) * 1024 * 1024,
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30")),
+    max_fast_queue=int(os.getenv("ADMISSION_MAX_FAST_QUEUE", "16")),
+    max_slow_wait=float(os.getenv("ADMISSION_MAX_SLOW_WAIT", "5")),
+)
+
+# Approximate number of full-size decoded arrays each operation keeps alive
+HIDE_COPIES = 4
+EXTRACT_COPIES = 3
+ANALYZE_COPIES = 5
+
+def estimate_request_bytes(upload: UploadFile, copies: int) -> int:
+    declared_size = upload.size or 0
+    filename = (upload.filename or "").lower()
+    if filename.endswith(IMAGE_EXTENSIONS):
+        return estimate_image_bytes(upload.file, declared_size, copies)
+    if filename.endswith(AUDIO_EXTENSIONS):
+        return estimate_audio_bytes(upload.file, declared_size, copies)
+    return declared_size
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.get("/metrics/admission")
+def admission_metrics():
+    return admission.stats()
+
 @app.post("/hide")
 async def hide_data(
     background_tasks: BackgroundTasks,
@@ -65,155 +123,323 @@ async def hide_data(
     password: str = Form(None),
     n_bits: int = Form(2)
 ):
-    try:
-        # Check carrier file size
-        if carrier_file.size and carrier_file.size > MAX_FILE_SIZE_STEGANOGRAPHY:
-             raise HTTPException(status_code=413, detail="Carrier file too large (max 100MB)")
-
-        # Determine secret data
-        if secret_file:
-            if secret_file.size and secret_file.size > MAX_FILE_SIZE_STEGANOGRAPHY:
-                 raise HTTPException(status_code=413, detail="Secret file too large (max 100MB)")
-            secret_data = await secret_file.read()
-        elif secret_text:
-            secret_data = secret_text.encode()
-        else:
-            raise HTTPException(status_code=400, detail="No secret data provided")
-
-        filename = carrier_file.filename.lower()
+    # Reject bad requests before reserving memory for them
+    if carrier_file.size and carrier_file.size > MAX_FILE_SIZE_STEGANOGRAPHY:
+         raise HTTPException(status_code=413, detail="Carrier file too large (max 100MB)")
+    filename = (carrier_file.filename or "").lower()
+    if not filename.endswith(IMAGE_EXTENSIONS + AUDIO_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Unsupported carrier file type")
+    if secret_file:
+        if secret_file.size and secret_file.size > MAX_FILE_SIZE_STEGANOGRAPHY:
+             raise HTTPException(status_code=413, detail="Secret file too large (max 100MB)")
+    elif not secret_text:
+        raise HTTPException(status_code=400, detail="No secret data provided")
+
+    estimate = estimate_request_bytes(carrier_file, HIDE_COPIES)
+    if secret_file:
+        estimate += secret_file.size or 0
+
+    async with admission.reserve(estimate):
+        try:
+            # Determine secret data
+            if secret_file:
+                secret_data = await secret_file.read()
+            else:
+                secret_data = secret_text.encode()
         
-        if filename.endswith(('.png', '.jpg', '.jpeg', '.bmp')):
-            # Image Steganography
-            image_bytes = await carrier_file.read()
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            if filename.endswith(IMAGE_EXTENSIONS):
+                # Image Steganography
+                # Decoding and embedding are CPU-bound; keep them off the event loop
+                image_bytes = await carrier_file.read()
+                img = await run_in_threadpool(open_image, image_bytes)
             
-            stego_img = stego_service.hide_data(img, secret_data, password, n_bits=n_bits)
+                stego_img = await run_in_threadpool(stego_service.hide_data, img, secret_data, password, n_bits=n_bits)
             
-            # ALWAYS save as PNG for steganography to avoid lossy compression
-            unique_id = uuid.uuid4().hex
-            output_filename = f"stego_{unique_id}.png"
-            output_path = get_tmp_path(output_filename)
-            stego_img.save(output_path, format="PNG")
+                # ALWAYS save as PNG for steganography to avoid lossy compression
+                unique_id = uuid.uuid4().hex
+                output_filename = f"stego_{unique_id}.png"
+                output_path = get_tmp_path(output_filename)
+                await run_in_threadpool(stego_img.save, output_path, format="PNG")
             
-            background_tasks.add_task(safe_remove, output_path)
-            return FileResponse(output_path, media_type="image/png", filename=output_filename)
+                background_tasks.add_task(safe_remove, output_path)
+                return FileResponse(output_path, media_type="image/png", filename=output_filename)
             
-        elif filename.endswith(('.wav', '.flac')):
-            # Audio Steganography
-            unique_id = uuid.uuid4().hex
-            input_path = get_tmp_path(f"carrier_{unique_id}.wav")
-            with open(input_path, "wb") as buffer:
-                shutil.copyfileobj(carrier_file.file, buffer)
+            else:
+                # Audio Steganography
+                unique_id = uuid.uuid4().hex
+                input_path = get_tmp_path(f"carrier_{unique_id}.wav")
+                await run_in_threadpool(copy_upload, carrier_file, input_path)
                 
-            output_filename = f"stego_{unique_id}.wav"
-            output_path = get_tmp_path(output_filename)
-            audio_stego_service.hide_data(input_path, secret_data, output_path, password=password, n_bits=n_bits)
+                output_filename = f"stego_{unique_id}.wav"
+                output_path = get_tmp_path(output_filename)
+                await run_in_threadpool(
+                    audio_stego_service.hide_data, input_path, secret_data, output_path, password=password, n_bits=n_bits
+                )
             
-            def cleanup_audio_hide():
-                safe_remove(input_path)
-                safe_remove(output_path)
+                def cleanup_audio_hide():
+                    safe_remove(input_path)
+                    safe_remove(output_path)
             
-            background_tasks.add_task(cleanup_audio_hide)
-            return FileResponse(output_path, media_type="audio/wav", filename=output_filename)
-            
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported carrier file type")
+                background_tasks.add_task(cleanup_audio_hide)
+                return FileResponse(output_path, media_type="audio/wav", filename=output_filename)
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+# Payloads smaller than this that decode as UTF-8 are returned inline as JSON text
+TEXT_RESPONSE_MAX_BYTES = 1024 * 1024 # 1MB
+# filetype only inspects the first 8KB of a file
+SNIFF_PREFIX_BYTES = 8192
+
+async def build_extraction_response(chunks, hold: AsyncExitStack):
+    """
+    Buffers chunks of an extracted payload until TEXT_RESPONSE_MAX_BYTES are held;
+    the last chunk read may overshoot the limit by less than one chunk, and with
+    full-size chunks the prefix stops at exactly the limit. Smaller UTF-8
+    payloads are returned as JSON text; anything else is streamed to the client
+    with its type guessed from the buffered prefix. A streamed response takes
+    over `hold` and closes it once the body is finished. Returns None if the
+    payload is empty.
+    """
+    prefix = bytearray()
+    exhausted = False
+    while len(prefix) < TEXT_RESPONSE_MAX_BYTES:
+        chunk = await run_in_threadpool(next, chunks, None)
+        if chunk is None:
+            exhausted = True
+            break
+        prefix += chunk
+
+    if not prefix:
+        return None
+    prefix = bytes(prefix)
+
+    is_text = False
+    if exhausted:
+        try:
+            return {"type": "text", "content": prefix.decode('utf-8')}
+        except UnicodeDecodeError:
+            pass
+    else:
+        try:
+            # A prefix may end mid-character, so decode without finalizing
+            codecs.getincrementaldecoder('utf-8')().decode(prefix[:SNIFF_PREFIX_BYTES], final=False)
+            is_text = True
+        except UnicodeDecodeError:
+            pass
+
+    kind = filetype.guess(prefix[:SNIFF_PREFIX_BYTES])
+    if kind:
+        mime_type, ext = kind.mime, kind.extension
+    elif is_text:
+        mime_type, ext = "text/plain; charset=utf-8", "txt"
+    else:
+        mime_type, ext = "application/octet-stream", "bin"
+
+    release = hold.pop_all()
+
+    async def body():
+        try:
+            yield prefix
+            async for chunk in iterate_in_threadpool(chunks):
+                yield chunk
+        finally:
+            await release.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type=mime_type,
+        headers={"Content-Disposition": f'attachment; filename="extracted_data.{ext}"'},
+    )
 
 @app.post("/extract")
 async def extract_data(
-    background_tasks: BackgroundTasks,
     stego_file: UploadFile = File(...),
     password: str = Form(None),
     n_bits: int = Form(2)
 ):
-    try:
-        if stego_file.size and stego_file.size > MAX_FILE_SIZE_STEGANALYSIS:
-             raise HTTPException(status_code=413, detail="Stego file too large (max 300MB)")
-        
-        filename = stego_file.filename.lower()
-        
-        if filename.endswith(('.png', '.jpg', '.jpeg', '.bmp')):
-            # Image Steganography
-            image_bytes = await stego_file.read()
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            extracted_bytes = stego_service.extract_data(img, password, n_bits=n_bits)
-            
-            if not extracted_bytes:
-                return JSONResponse(status_code=404, content={"message": "No hidden data found"})
-                
-            # Try to detect if it's text
-            try:
-                text = extracted_bytes.decode('utf-8')
-                return {"type": "text", "content": text}
-            except UnicodeDecodeError:
-                # Return as binary file
-                kind = filetype.guess(extracted_bytes)
-                mime_type = kind.mime if kind else "application/octet-stream"
-                ext = kind.extension if kind else "bin"
+    # Reject bad requests before reserving memory for them
+    if stego_file.size and stego_file.size > MAX_FILE_SIZE_STEGANALYSIS:
+         raise HTTPException(status_code=413, detail="Stego file too large (max 300MB)")
+    filename = (stego_file.filename or "").lower()
+    if not filename.endswith(IMAGE_EXTENSIONS + AUDIO_EXTENSIONS):
+         raise HTTPException(status_code=400, detail="Unsupported file type")
 
+    estimate = estimate_request_bytes(stego_file, EXTRACT_COPIES)
+
+    async with AsyncExitStack() as hold:
+        await hold.enter_async_context(admission.reserve(estimate))
+        try:
+            if filename.endswith(IMAGE_EXTENSIONS):
+                # Image Steganography
+                image_bytes = await stego_file.read()
+                img = await run_in_threadpool(open_image, image_bytes)
+                del image_bytes
+                chunks = await run_in_threadpool(stego_service.extract_stream, img, password, n_bits=n_bits)
+
+            else:
+                # Audio Steganography
                 unique_id = uuid.uuid4().hex
-                output_path = get_tmp_path(f"extracted_file_{unique_id}.{ext}")
-                with open(output_path, "wb") as f:
-                    f.write(extracted_bytes)
+                input_path = get_tmp_path(f"stego_{unique_id}.wav")
+                await run_in_threadpool(copy_upload, stego_file, input_path)
                 
-                background_tasks.add_task(safe_remove, output_path)
-                return FileResponse(output_path, media_type=mime_type, filename=f"extracted_data.{ext}")
+                try:
+                    chunks = await run_in_threadpool(
+                        audio_stego_service.extract_stream, input_path, password=password, n_bits=n_bits
+                    )
+                finally:
+                    safe_remove(input_path)
+
+            response = await build_extraction_response(chunks, hold) if chunks is not None else None
+            if response is None:
+                return JSONResponse(status_code=404, content={"message": "No hidden data found"})
+            return response
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+MAX_SHARDS = 64
+
+def save_upload(upload: UploadFile, prefix: str) -> str:
+    """Copies an upload to tmp_uploads, keeping image extensions (audio is stored as .wav)."""
+    filename = upload.filename.lower()
+    ext = os.path.splitext(filename)[1] if filename.endswith(IMAGE_EXTENSIONS) else ".wav"
+    path = get_tmp_path(f"{prefix}_{uuid.uuid4().hex}{ext}")
+    copy_upload(upload, path)
+    return path
+
+def write_shard_archive(archive_path: str, output_paths: List[str]):
+    """Stores the shards in a zip, named by position. Stego carriers are already
+    compressed (PNG) or raw PCM, so they are stored as-is."""
+    total = len(output_paths)
+    with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for index, output_path in enumerate(output_paths):
+            archive.write(output_path, arcname=f"shard_{index:03d}_of_{total:03d}{os.path.splitext(output_path)[1]}")
 
-        elif filename.endswith(('.wav', '.flac')):
-            # Audio Steganography
+def check_shard_uploads(uploads: List[UploadFile], max_size: int, too_large_detail: str):
+    if not uploads or len(uploads) > MAX_SHARDS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {MAX_SHARDS} files")
+    for upload in uploads:
+        if not (upload.filename or "").lower().endswith(IMAGE_EXTENSIONS + AUDIO_EXTENSIONS):
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {upload.filename}")
+        if upload.size and upload.size > max_size:
+             raise HTTPException(status_code=413, detail=too_large_detail)
+
+@app.post("/hide/sharded")
+async def hide_data_sharded(
+    background_tasks: BackgroundTasks,
+    carrier_files: List[UploadFile] = File(...),
+    secret_file: UploadFile = File(None),
+    secret_text: str = Form(None),
+    password: str = Form(None),
+    n_bits: int = Form(2)
+):
+    check_shard_uploads(carrier_files, MAX_FILE_SIZE_STEGANOGRAPHY, "Carrier file too large (max 100MB)")
+    if secret_file:
+        if secret_file.size and secret_file.size > MAX_FILE_SIZE_STEGANOGRAPHY:
+             raise HTTPException(status_code=413, detail="Secret file too large (max 100MB)")
+    elif not secret_text:
+        raise HTTPException(status_code=400, detail="No secret data provided")
+
+    estimate = sum(estimate_request_bytes(f, HIDE_COPIES) for f in carrier_files)
+    if secret_file:
+        estimate += secret_file.size or 0
+
+    async with admission.reserve(estimate):
+        carrier_paths = []
+        output_paths = []
+        try:
+            if secret_file:
+                secret_data = await secret_file.read()
+            else:
+                secret_data = secret_text.encode()
+
+            total = len(carrier_files)
             unique_id = uuid.uuid4().hex
-            input_path = get_tmp_path(f"stego_{unique_id}.wav")
-            with open(input_path, "wb") as buffer:
-                shutil.copyfileobj(stego_file.file, buffer)
-                
-            extracted_bytes = audio_stego_service.extract_data(input_path, password=password, n_bits=n_bits)
-            
-            safe_remove(input_path)
-            
-            if not extracted_bytes:
+            for index, carrier_file in enumerate(carrier_files):
+                carrier_path = await run_in_threadpool(save_upload, carrier_file, "carrier")
+                carrier_paths.append(carrier_path)
+                ext = ".wav" if carrier_path.endswith(".wav") else ".png"
+                output_paths.append(get_tmp_path(f"shard_{unique_id}_{index:03d}_of_{total:03d}{ext}"))
+
+            await run_in_threadpool(
+                sharding_service.hide_sharded, carrier_paths, secret_data, output_paths, password=password, n_bits=n_bits
+            )
+
+            archive_filename = f"stego_shards_{unique_id}.zip"
+            archive_path = get_tmp_path(archive_filename)
+            await run_in_threadpool(write_shard_archive, archive_path, output_paths)
+
+            background_tasks.add_task(safe_remove, archive_path)
+            return FileResponse(archive_path, media_type="application/zip", filename=archive_filename)
+
+        except HTTPException:
+            raise
+        except ShardCapacityError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            for path in carrier_paths + output_paths:
+                safe_remove(path)
+
+@app.post("/extract/sharded")
+async def extract_data_sharded(
+    stego_files: List[UploadFile] = File(...),
+    password: str = Form(None),
+    n_bits: int = Form(2)
+):
+    check_shard_uploads(stego_files, MAX_FILE_SIZE_STEGANALYSIS, "Stego file too large (max 300MB)")
+    estimate = sum(estimate_request_bytes(f, EXTRACT_COPIES) for f in stego_files)
+
+    async with AsyncExitStack() as hold:
+        await hold.enter_async_context(admission.reserve(estimate))
+        stego_paths = []
+        try:
+            for stego_file in stego_files:
+                stego_paths.append(await run_in_threadpool(save_upload, stego_file, "stego"))
+
+            secret = await run_in_threadpool(
+                sharding_service.extract_sharded, stego_paths, password=password, n_bits=n_bits
+            )
+
+            response = await build_extraction_response(iter([secret]), hold)
+            if response is None:
                 return JSONResponse(status_code=404, content={"message": "No hidden data found"})
-            
-            try:
-                text = extracted_bytes.decode('utf-8')
-                return {"type": "text", "content": text}
-            except UnicodeDecodeError:
-                kind = filetype.guess(extracted_bytes)
-                mime_type = kind.mime if kind else "application/octet-stream"
-                ext = kind.extension if kind else "bin"
-
-                output_path = get_tmp_path(f"extracted_audio_data_{unique_id}.{ext}")
-                with open(output_path, "wb") as f:
-                    f.write(extracted_bytes)
-                    
-                background_tasks.add_task(safe_remove, output_path)
-                return FileResponse(output_path, media_type=mime_type, filename=f"extracted_data.{ext}")
-        else:
-             raise HTTPException(status_code=400, detail="Unsupported file type")
+            return response
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        except HTTPException:
+            raise
+        except ShardSetError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            for path in stego_paths:
+                safe_remove(path)
 
 @app.post("/analyze")
-async def analyze_file(file: UploadFile = File(...)):
-    try:
-        if file.size and file.size > MAX_FILE_SIZE_STEGANALYSIS:
-             raise HTTPException(status_code=413, detail="File too large (max 300MB)")
-             
-        filename = file.filename.lower()
-        if filename.endswith(('.png', '.jpg', '.jpeg', '.bmp')):
+async def analyze_file(file: UploadFile = File(...), mode: str = Form("full"), seed: int = Form(None)):
+    if mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported analysis mode (choose from {', '.join(ANALYSIS_MODES)})")
+
+    if file.size and file.size > MAX_FILE_SIZE_STEGANALYSIS:
+         raise HTTPException(status_code=413, detail="File too large (max 300MB)")
+    if not (file.filename or "").lower().endswith(IMAGE_EXTENSIONS):
+        return {"message": "Analysis currently only supported for images"}
+
+    estimate = estimate_request_bytes(file, ANALYZE_COPIES)
+
+    async with admission.reserve(estimate):
+        try:
             image_bytes = await file.read()
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            
-            result = analysis_service.analyze(img)
+            img = await run_in_threadpool(open_image, image_bytes)
+        
+            result = await run_in_threadpool(analysis_service.analyze, img, mode=mode, seed=seed)
             return result
-        else:
-            return {"message": "Analysis currently only supported for images"}
             
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,392 @@
+"""
+Local load-test harness for the StegDETECT API.
+
+Starts the FastAPI app with uvicorn, drives a weighted mix of /hide, /extract
+and /analyze requests built from synthetic carriers, and reports throughput,
+latency percentiles, error rates and worker RSS over time.
+
+Usage (from backend/):
+    python -m loadtest.run loadtest/scenarios/mixed.json --output results.json
+    python -m loadtest.run loadtest/scenarios/mixed.json --compare results.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+import soundfile as sf
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from services.stego import StegoService
+from services.audio_stego import AudioStegoService
+
+DEFAULTS = {
+    "seed": 0,
+    "duration_seconds": 30,
+    "concurrency": 4,
+    "rate_per_second": None,
+    "timeout_seconds": 120,
+    "sample_interval_seconds": 0.5,
+    "server": {"workers": 1, "env": {}},
+}
+
+# ---------------------------------------------------------------------------
+# Synthetic carriers
+
+def make_image(spec: dict, rng: np.random.Generator) -> bytes:
+    """Smooth gradient plus sensor-like noise, encoded as PNG."""
+    height, width = spec["height"], spec["width"]
+    y, x = np.mgrid[0:height, 0:width]
+    base = 128 + 60 * np.sin(x / 97.0) + 40 * np.cos(y / 71.0) + rng.normal(0, 6, (height, width))
+    pixels = np.clip(np.stack([base, base * 0.9, base * 1.1], axis=-1), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def make_audio(spec: dict, rng: np.random.Generator) -> bytes:
+    """Tone plus noise, encoded as 16-bit WAV."""
+    samplerate = spec.get("samplerate", 44100)
+    channels = spec.get("channels", 2)
+    t = np.arange(int(spec["seconds"] * samplerate)) / samplerate
+    tone = 8000 * np.sin(2 * np.pi * 440 * t)[:, None] + rng.normal(0, 300, (len(t), channels))
+    buffer = io.BytesIO()
+    sf.write(buffer, tone.astype(np.int16), samplerate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+def make_stego(carrier: bytes, kind: str, secret: bytes, password: str, n_bits: int) -> bytes:
+    """Prepares an /extract input locally so setup doesn't count against the run."""
+    if kind == "image":
+        img = Image.open(io.BytesIO(carrier)).convert("RGB")
+        stego = StegoService().hide_data(img, secret, password, n_bits=n_bits)
+        buffer = io.BytesIO()
+        stego.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "carrier.wav")
+        output_path = os.path.join(tmp, "stego.wav")
+        with open(input_path, "wb") as f:
+            f.write(carrier)
+        AudioStegoService().hide_data(input_path, secret, output_path, password=password, n_bits=n_bits)
+        with open(output_path, "rb") as f:
+            return f.read()
+
+def build_requests(config: dict, rng: np.random.Generator) -> list:
+    """Turns each mix entry into a ready-to-send request template."""
+    carriers = {}
+    for name, spec in config["carriers"].items():
+        data = make_image(spec, rng) if spec["type"] == "image" else make_audio(spec, rng)
+        ext = "png" if spec["type"] == "image" else "wav"
+        carriers[name] = (spec["type"], f"{name}.{ext}", data)
+
+    templates = []
+    for entry in config["mix"]:
+        kind, filename, data = carriers[entry["carrier"]]
+        endpoint = entry["endpoint"]
+        form = {"n_bits": str(entry.get("n_bits", 2))}
+        if entry.get("password"):
+            form["password"] = entry["password"]
+        secret = rng.bytes(entry.get("secret_bytes", 1024))
+
+        if endpoint == "hide":
+            files = {"carrier_file": (filename, data), "secret_file": ("secret.bin", secret)}
+        elif endpoint == "extract":
+            stego = make_stego(data, kind, secret, entry.get("password"), entry.get("n_bits", 2))
+            files = {"stego_file": (filename, stego)}
+        elif endpoint == "analyze":
+            files = {"file": (filename, data)}
+            form = {"mode": entry.get("mode", "full")}
+        else:
+            raise ValueError(f"Unknown endpoint: {endpoint}")
+
+        templates.append({
+            "label": entry.get("label", f"{endpoint}:{entry['carrier']}"),
+            "path": f"/{endpoint}",
+            "files": files,
+            "data": form,
+            "weight": entry.get("weight", 1),
+        })
+    return templates
+
+# ---------------------------------------------------------------------------
+# Server and RSS sampling
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(server: dict, port: int) -> subprocess.Popen:
+    env = dict(os.environ, **{k: str(v) for k, v in server.get("env", {}).items()})
+    cmd = [
+        sys.executable, "-m", "uvicorn", "app:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(server.get("workers", 1)),
+        "--log-level", "warning",
+    ]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+
+async def wait_until_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(base_url + "/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+def process_tree(pid: int) -> list:
+    """pid and all its descendants, via /proc (Linux only)."""
+    pids = [pid]
+    for current in pids:
+        task_dir = f"/proc/{current}/task"
+        try:
+            for tid in os.listdir(task_dir):
+                with open(f"{task_dir}/{tid}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+def rss_bytes(pid: int):
+    """Total resident memory of the server process tree, or None where /proc is unavailable."""
+    total = 0
+    found = False
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        found = True
+                        break
+        except OSError:
+            continue
+    return total if found else None
+
+async def sample_rss(pid: int, interval: float, start: float, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        rss = rss_bytes(pid)
+        if rss is not None:
+            samples.append({"t": round(time.monotonic() - start, 3), "rss_bytes": rss})
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+# ---------------------------------------------------------------------------
+# Load generation
+
+async def send(client: httpx.AsyncClient, template: dict, scheduled: float, results: list, start: float):
+    status = None
+    error = None
+    try:
+        response = await client.post(template["path"], files=template["files"], data=template["data"])
+        await response.aread()
+        status = response.status_code
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+    results.append({
+        "label": template["label"],
+        "t": round(scheduled - start, 3),
+        # Measured from the scheduled send time so queueing inside the generator counts
+        "latency_ms": (time.monotonic() - scheduled) * 1000,
+        "status": status,
+        "error": error,
+    })
+
+async def drive(config: dict, base_url: str, templates: list, rng: np.random.Generator, start: float) -> list:
+    """
+    Open loop when rate_per_second is set (fixed arrival schedule, at most
+    `concurrency` requests in flight), otherwise a closed loop of
+    `concurrency` clients sending back-to-back.
+    """
+    weights = np.array([t["weight"] for t in templates], dtype=float)
+    weights /= weights.sum()
+    duration = config["duration_seconds"]
+    concurrency = config["concurrency"]
+    rate = config["rate_per_second"]
+    results = []
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=config["timeout_seconds"], limits=limits) as client:
+        if rate:
+            # Pre-draw the request sequence so runs are reproducible regardless of timing
+            count = int(duration * rate)
+            choices = rng.choice(len(templates), size=count, p=weights)
+            slots = asyncio.Semaphore(concurrency)
+
+            async def scheduled_send(i: int, choice: int):
+                scheduled = start + i / rate
+                await asyncio.sleep(max(0.0, scheduled - time.monotonic()))
+                async with slots:
+                    await send(client, templates[choice], scheduled, results, start)
+
+            await asyncio.gather(*(scheduled_send(i, c) for i, c in enumerate(choices)))
+        else:
+            deadline = start + duration
+
+            async def closed_loop(worker_rng: np.random.Generator):
+                while time.monotonic() < deadline:
+                    choice = worker_rng.choice(len(templates), p=weights)
+                    await send(client, templates[choice], time.monotonic(), results, start)
+
+            seeds = rng.integers(0, 2**32, size=concurrency)
+            await asyncio.gather(*(closed_loop(np.random.default_rng(int(s))) for s in seeds))
+    return results
+
+# ---------------------------------------------------------------------------
+# Reporting
+
+def summarize(results: list) -> dict:
+    """
+    Any non-2xx response counts as an error, so a functional regression (e.g. a
+    404 from /extract) can't pass as a success. Client (4xx) and server (5xx or
+    transport) failures are also reported separately.
+    """
+    latencies = np.array([r["latency_ms"] for r in results]) if results else np.zeros(1)
+    client_errors = sum(1 for r in results if r["status"] is not None and 400 <= r["status"] < 500)
+    server_errors = sum(1 for r in results if r["status"] is None or r["status"] >= 500)
+    errors = sum(1 for r in results if r["status"] is None or not 200 <= r["status"] < 300)
+    total = len(results)
+    status_counts = {}
+    for r in results:
+        key = str(r["status"]) if r["status"] is not None else r["error"]
+        status_counts[key] = status_counts.get(key, 0) + 1
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "client_error_rate": client_errors / total if total else 0.0,
+        "server_error_rate": server_errors / total if total else 0.0,
+        "status_counts": status_counts,
+        "latency_ms": {
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "p99": float(np.percentile(latencies, 99)),
+            "max": float(latencies.max()),
+        },
+    }
+
+def build_report(config: dict, results: list, rss_samples: list, elapsed: float) -> dict:
+    overall = summarize(results)
+    overall["throughput_rps"] = len(results) / elapsed if elapsed else 0.0
+    labels = sorted({r["label"] for r in results})
+    return {
+        "scenario": config.get("name", "unnamed"),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": config,
+        "elapsed_seconds": elapsed,
+        "overall": overall,
+        "endpoints": {label: summarize([r for r in results if r["label"] == label]) for label in labels},
+        "rss": {
+            "peak_bytes": max((s["rss_bytes"] for s in rss_samples), default=None),
+            "samples": rss_samples,
+        },
+    }
+
+def print_report(report: dict, baseline: dict = None):
+    def row(name, stats, base=None):
+        lat = stats["latency_ms"]
+        line = (f"{name:<28} {stats['requests']:>7} {stats['error_rate'] * 100:>6.1f}% "
+                f"{stats['client_error_rate'] * 100:>6.1f}% {stats['server_error_rate'] * 100:>6.1f}% "
+                f"{lat['p50']:>9.1f} {lat['p95']:>9.1f} {lat['p99']:>9.1f}")
+        if base:
+            line += f"   p99 {lat['p99'] - base['latency_ms']['p99']:+.1f}ms"
+            line += f"   errors {(stats['error_rate'] - base['error_rate']) * 100:+.1f}%"
+        print(line)
+
+    overall = report["overall"]
+    print(f"\nScenario: {report['scenario']}  ({report['elapsed_seconds']:.1f}s)")
+    print(f"Throughput: {overall['throughput_rps']:.2f} req/s", end="")
+    if baseline:
+        print(f"  (baseline {baseline['overall']['throughput_rps']:.2f})", end="")
+    print()
+    peak = report["rss"]["peak_bytes"]
+    if peak is not None:
+        print(f"Peak worker RSS: {peak / 2**20:.1f} MB")
+    print(f"\n{'endpoint':<28} {'reqs':>7} {'errors':>7} {'4xx':>7} {'5xx':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    row("overall", overall, baseline and baseline["overall"])
+    for label, stats in report["endpoints"].items():
+        row(label, stats, baseline and baseline["endpoints"].get(label))
+
+def load_config(path: str) -> dict:
+    with open(path) as f:
+        config = json.load(f)
+    merged = dict(DEFAULTS, **config)
+    merged["server"] = dict(DEFAULTS["server"], **config.get("server", {}))
+    return merged
+
+async def run(config: dict, base_url: str = None) -> dict:
+    rng = np.random.default_rng(config["seed"])
+    templates = build_requests(config, rng)
+
+    server = None
+    if base_url is None:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(config["server"], port)
+
+    rss_samples = []
+    stop = asyncio.Event()
+    try:
+        await wait_until_ready(base_url)
+        start = time.monotonic()
+        sampler = None
+        if server is not None:
+            sampler = asyncio.create_task(sample_rss(server.pid, config["sample_interval_seconds"], start, rss_samples, stop))
+        results = await drive(config, base_url, templates, rng, start)
+        elapsed = time.monotonic() - start
+        stop.set()
+        if sampler is not None:
+            await sampler
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    return build_report(config, results, rss_samples, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the StegDETECT API")
+    parser.add_argument("scenario", help="Path to a JSON scenario file")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Previous JSON report to compare against")
+    parser.add_argument("--base-url", help="Target an already running server instead of starting one")
+    args = parser.parse_args()
+
+    config = load_config(args.scenario)
+    report = asyncio.run(run(config, base_url=args.base_url))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import soundfile as sf
+from PIL import Image
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be queued for its memory reservation."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+def estimate_image_bytes(file_obj, declared_size: int, copies: int) -> int:
+    """
+    Estimates the working memory of an image request from its header:
+    the encoded upload plus one decoded frame and `copies` RGB arrays.
+    Falls back to the declared size when the header cannot be read.
+    """
+    try:
+        pos = file_obj.tell()
+        with Image.open(file_obj) as img:
+            width, height = img.size
+            bands = len(img.getbands())
+        file_obj.seek(pos)
+    except Exception:
+        file_obj.seek(0)
+        return declared_size * (copies + 1)
+    return declared_size + width * height * (bands + 3 * copies)
+
+def estimate_audio_bytes(file_obj, declared_size: int, copies: int) -> int:
+    """Same as estimate_image_bytes for int16 audio decoded by soundfile."""
+    try:
+        pos = file_obj.tell()
+        info = sf.info(file_obj)
+        file_obj.seek(pos)
+    except Exception:
+        file_obj.seek(0)
+        return declared_size * (copies + 1)
+    return declared_size + info.frames * info.channels * 2 * copies
+
+class AdmissionController:
+    """
+    Per-process memory budget for request admission.
+
+    Each request reserves its estimated working memory before doing any work.
+    Requests that don't fit wait in a bounded queue; small requests use a
+    separate fast lane, with its own bound, so they are neither stuck behind
+    nor turned away by large ones. When a request's lane is full, or it waits
+    longer than queue_timeout, AdmissionRejected is raised with a Retry-After hint.
+
+    To keep a steady stream of small requests from starving a large one, once
+    the head of the slow lane has waited max_slow_wait seconds no further small
+    requests are admitted until it has been.
+    """
+
+    def __init__(self, budget_bytes: int, max_queue: int = 16,
+                 small_request_bytes: int = 64 * 1024 * 1024, queue_timeout: float = 30.0,
+                 max_fast_queue: int = None, max_slow_wait: float = 5.0):
+        self.budget_bytes = budget_bytes
+        self.max_queue = max_queue
+        self.max_fast_queue = max_queue if max_fast_queue is None else max_fast_queue
+        self.small_request_bytes = small_request_bytes
+        self.queue_timeout = queue_timeout
+        self.max_slow_wait = max_slow_wait
+
+        self._in_use = 0
+        self._fast_lane = deque()
+        self._slow_lane = deque()
+
+        # Stats
+        self._admitted = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._avg_hold = 1.0
+
+    def _queue_depth(self) -> int:
+        return len(self._fast_lane) + len(self._slow_lane)
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._avg_hold))
+
+    def _slow_lane_starving(self) -> bool:
+        while self._slow_lane and self._slow_lane[0][1].done():
+            self._slow_lane.popleft()
+        if not self._slow_lane:
+            return False
+        return time.monotonic() - self._slow_lane[0][2] >= self.max_slow_wait
+
+    def _wake(self):
+        # Fast lane first unless the slow lane is starving; each lane is FIFO
+        # and stops at the first request that doesn't fit
+        while True:
+            lanes = (self._slow_lane,) if self._slow_lane_starving() else (self._fast_lane, self._slow_lane)
+            for lane in lanes:
+                while lane and lane[0][1].done():
+                    lane.popleft()
+                if lane and self._in_use + lane[0][0] <= self.budget_bytes:
+                    nbytes, fut, _ = lane.popleft()
+                    self._in_use += nbytes
+                    fut.set_result(None)
+                    break
+            else:
+                return
+
+    def _release(self, nbytes: int):
+        self._in_use -= nbytes
+        self._wake()
+
+    async def _acquire(self, nbytes: int):
+        lane = self._fast_lane if nbytes <= self.small_request_bytes else self._slow_lane
+
+        starved = lane is self._fast_lane and self._slow_lane_starving()
+        if not lane and not starved and self._in_use + nbytes <= self.budget_bytes:
+            self._in_use += nbytes
+            return
+
+        limit = self.max_fast_queue if lane is self._fast_lane else self.max_queue
+        if len(lane) >= limit:
+            self._rejected += 1
+            raise AdmissionRejected("Server busy: admission queue is full", self._retry_after())
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (nbytes, fut, time.monotonic())
+        lane.append(entry)
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # Granted right as we gave up; hand the reservation back
+                self._release(nbytes)
+            else:
+                try:
+                    lane.remove(entry)
+                except ValueError:
+                    pass
+                # Whoever was queued behind us may fit now
+                self._wake()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._rejected += 1
+            raise AdmissionRejected("Server busy: timed out waiting for memory", self._retry_after())
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int):
+        """Holds a reservation of nbytes for the duration of the block."""
+        # A request larger than the whole budget still runs, but alone
+        nbytes = max(1, min(int(nbytes), self.budget_bytes))
+
+        start = time.monotonic()
+        await self._acquire(nbytes)
+        admitted_at = time.monotonic()
+
+        wait = admitted_at - start
+        self._admitted += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+
+        try:
+            yield
+        finally:
+            hold = time.monotonic() - admitted_at
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * hold
+            self._release(nbytes)
+
+    def stats(self) -> dict:
+        return {
+            "budget_bytes": self.budget_bytes,
+            "in_use_bytes": self._in_use,
+            "queue_depth": self._queue_depth(),
+            "fast_lane_depth": len(self._fast_lane),
+            "slow_lane_depth": len(self._slow_lane),
+            "max_queue": self.max_queue,
+            "max_fast_queue": self.max_fast_queue,
+            "slow_lane_starving": self._slow_lane_starving(),
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "avg_wait_seconds": self._total_wait / self._admitted if self._admitted else 0.0,
+            "max_wait_seconds": self._max_wait,
+        }
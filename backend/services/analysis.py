@@ -1,11 +1,25 @@
+import hashlib
 import numpy as np
 from PIL import Image
 from scipy.stats import chisquare
+from scipy.stats import t as t_dist
+
+# Decision thresholds used by analyze() to categorize the final suspicion
+UNCERTAIN_THRESHOLD = 0.15
+SUSPICIOUS_THRESHOLD = 0.4
+CRITICAL_THRESHOLD = 0.75
+DECISION_THRESHOLDS = (UNCERTAIN_THRESHOLD, SUSPICIOUS_THRESHOLD, CRITICAL_THRESHOLD)
+
+ANALYSIS_MODES = ("full", "triage", "auto")
 
 class SteganalysisService:
-    def __init__(self):
+    def __init__(self, sample_fraction: float = 0.05, strata: int = 16, min_triage_pixels: int = 1_000_000):
         # No ML model needed for statistical analysis
-        pass
+        # Triage settings: fraction of rows to sample, number of row bands
+        # to stratify over, and the image size below which triage is not worth it.
+        self.sample_fraction = sample_fraction
+        self.strata = strata
+        self.min_triage_pixels = min_triage_pixels
 
     def chi_square_test(self, image: Image.Image):
         """
@@ -15,14 +29,15 @@ class SteganalysisService:
         if image.mode != 'RGB':
             image = image.convert('RGB')
         
-        img_array = np.array(image)
+        # Image.histogram() returns the 3 x 256 channel counts without copying pixels
+        return self._chi_square_counts(np.array(image.histogram()).reshape(3, 256))
+
+    def _chi_square_counts(self, histograms: np.ndarray) -> float:
+        """Chi-Square score from per-channel 256-bin histograms."""
         channel_scores = []
         
         # Analyze each channel
-        for c in range(3): # R, G, B
-            channel_data = img_array[:,:,c].flatten()
-            counts = np.bincount(channel_data, minlength=256)
-            
+        for counts in histograms: # R, G, B
             obs = []
             exp = []
             
@@ -58,8 +73,14 @@ class SteganalysisService:
         else:
             gray_image = image
             
-        img = np.array(gray_image, dtype=np.int16)
-        
+        counts = self._rs_counts(np.array(gray_image, dtype=np.int16))
+        return self._rs_suspicion(self._rs_ratio(counts))
+
+    def _rs_counts(self, img: np.ndarray) -> np.ndarray:
+        """
+        Block counts behind the RS statistic for an (H, W) int16 grayscale array:
+        [valid, R_M, S_M, R_-M, S_-M]. Counts from disjoint row blocks can be summed.
+        """
         # We use 1x2 blocks. 
         # x are the even columns (first pixel in pair)
         # y are the odd columns (second pixel in pair)
@@ -81,66 +102,46 @@ class SteganalysisService:
         shift_y = (lsb_y * 2) - 1
         y_fm1 = y + shift_y
         
-        # Negative Mask -M = [1, 0]
-        # F1 flips LSB of the first pixel (x)
-        x_f1 = x ^ 1
-        
-        # F-1 shifts LSB of the first pixel (x)
-        lsb_x = x & 1
-        shift_x = (lsb_x * 2) - 1
-        x_fm1 = x + shift_x
-        
         # Discriminant function is the absolute difference between the pair
         d_0 = np.abs(x - y)            # Original block
         d_f1_pos = np.abs(x - y_f1)    # M=[0,1], F1
         d_fm1_pos = np.abs(x - y_fm1)  # M=[0,1], F-1
         
-        d_f1_neg = np.abs(x_f1 - y)    # M=[1,0], F1
-        d_fm1_neg = np.abs(x_fm1 - y)  # M=[1,0], F-1
-        
-        # Filtering perfectly flat blocks (d_0 == 0 AND d_f1 == 1) 
-        # Actually, standard RS just counts everything, but flat blocks heavily skew synthetic gradients.
-        # Let's count them normally but ensure we don't divide by zero.
-        
-        total_blocks = x.size
         # To avoid division by zero and extreme skew from flat areas, 
         # we can only consider blocks where there is *some* variation or stego noise.
         valid_mask = (d_0 > 0) | (d_f1_pos > 0)
-        valid_count = np.sum(valid_mask)
         
+        return np.array([
+            np.sum(valid_mask),
+            np.sum((d_f1_pos > d_0) & valid_mask),   # R_M
+            np.sum((d_f1_pos < d_0) & valid_mask),   # S_M
+            np.sum((d_fm1_pos > d_0) & valid_mask),  # R_{-M}
+            np.sum((d_fm1_pos < d_0) & valid_mask),  # S_{-M}
+        ], dtype=np.int64)
+
+    def _rs_ratio(self, counts: np.ndarray):
+        """Divergence ratio |R_M - S_M| / |R_-M - S_-M|, or None when undefined."""
+        valid_count, r_m, s_m, r_m_m, s_m_m = counts
         if valid_count == 0:
-            return 0.0
+            return None
             
         # We'll use the valid count for normalization to keep percentages meaningful
-        
-        # R_M, S_M (Positive mask)
-        R_M = np.sum((d_f1_pos > d_0) & valid_mask) / valid_count
-        S_M = np.sum((d_f1_pos < d_0) & valid_mask) / valid_count
-        R_m_M = np.sum((d_fm1_pos > d_0) & valid_mask) / valid_count
-        S_m_M = np.sum((d_fm1_pos < d_0) & valid_mask) / valid_count
-        
-        # R_{-M}, S_{-M} (Negative mask)
-        R_M_neg = np.sum((d_f1_neg > d_0) & valid_mask) / valid_count
-        S_M_neg = np.sum((d_f1_neg < d_0) & valid_mask) / valid_count
-        R_m_M_neg = np.sum((d_fm1_neg > d_0) & valid_mask) / valid_count
-        S_m_M_neg = np.sum((d_fm1_neg < d_0) & valid_mask) / valid_count
-        
         # Synthetic gradients completely break the formal RS intersection math.
         # Instead, we use a robust heuristic based on the divergence of S_M and R_M under F1 and F-1.
-        
-        diff_M = abs(R_M - S_M)
-        diff_m_M = abs(R_m_M - S_m_M)
+        diff_M = abs(r_m - s_m) / valid_count
+        diff_m_M = abs(r_m_m - s_m_m) / valid_count
         
         if diff_m_M == 0:
-            return 0.0
-            
-        ratio = diff_M / diff_m_M
-        
+            return None
+        return diff_M / diff_m_M
+
+    def _rs_suspicion(self, ratio) -> float:
+        """Maps the RS ratio to a 0-1 suspicion score (non-increasing in the ratio)."""
         # A ratio near 1.0 means clean. A ratio near 0.0 means stego.
         # Synthetic gradients can cause ratio ~ 1.2 or 0.8 naturally. 
         # But stego drives it down to 0.5 or less quickly.
         
-        if ratio > 0.85:
+        if ratio is None or ratio > 0.85:
             return 0.0
             
         # Scale to a 0-1 suspicion score. 
@@ -149,13 +150,8 @@ class SteganalysisService:
         suspicion = 1.0 - ((ratio - 0.2) / 0.65)
         return float(max(0.0, min(1.0, suspicion)))
 
-    def analyze(self, image: Image.Image):
-        """
-        Analyzes an image for steganography using Chi-Square and RS Analysis.
-        """
-        chi_score = self.chi_square_test(image)
-        rs_score = self.rs_analysis(image)
-        
+    def _combine(self, chi_score: float, rs_score: float) -> float:
+        """Weighted combination of the Chi-Square and RS scores."""
         # Weighted combination with robustness check
         # Chi-Square is prone to false positives on gradients where LSBs are naturally uniform.
         # RS Analysis is much more robust.
@@ -168,22 +164,147 @@ class SteganalysisService:
             final_suspicion = min(final_suspicion, 0.4) 
         else:
             final_suspicion = (0.4 * chi_score) + (0.6 * rs_score)
-        
-        # Categorize
-        if final_suspicion > 0.75:
-            analysis = "Critical: Strong statistical evidence of hidden data."
-        elif final_suspicion > 0.4:
-            analysis = "Suspicious: Anomalies detected in bit plane statistics."
-        elif final_suspicion > 0.15:
-            analysis = "Uncertain: Mild deviations from natural statistics."
+        return final_suspicion
+
+    def _categorize(self, final_suspicion: float) -> str:
+        if final_suspicion > CRITICAL_THRESHOLD:
+            return "Critical: Strong statistical evidence of hidden data."
+        elif final_suspicion > SUSPICIOUS_THRESHOLD:
+            return "Suspicious: Anomalies detected in bit plane statistics."
+        elif final_suspicion > UNCERTAIN_THRESHOLD:
+            return "Uncertain: Mild deviations from natural statistics."
         else:
-            analysis = "Clean: No significant statistical anomalies detected."
-            
+            return "Clean: No significant statistical anomalies detected."
+
+    def _image_seed(self, image: Image.Image) -> int:
+        """Seed derived from the image size and first rows, so repeated requests sample the same rows."""
+        width, height = image.size
+        digest = hashlib.sha256(f"{width}x{height}".encode())
+        digest.update(image.crop((0, 0, width, min(height, 4))).tobytes())
+        return int.from_bytes(digest.digest()[:8], "big")
+
+    def _sample_blocks(self, image: Image.Image, seed=None):
+        """
+        Stratified row sampling: the image is split into equal horizontal bands
+        and a random run of rows is cropped from each band. Without a seed the
+        sample is derived from the image itself, so results are reproducible.
+        """
+        if seed is None:
+            seed = self._image_seed(image)
+        rng = np.random.default_rng(seed)
+        width, height = image.size
+        strata = max(1, min(self.strata, height // 2))
+        band_height = height // strata
+        block_rows = max(2, int(round(height * self.sample_fraction / strata)))
+        block_rows = min(block_rows, band_height)
+
+        blocks = []
+        for i in range(strata):
+            top = i * band_height + int(rng.integers(0, band_height - block_rows + 1))
+            blocks.append(image.crop((0, top, width, top + block_rows)))
+        return blocks
+
+    def _combined_range(self, chi_score: float, rs_low: float, rs_high: float):
+        """Range of _combine over an RS interval; it jumps at rs = 0.1, so check both sides."""
+        candidates = [rs_low, rs_high]
+        if rs_low < 0.1 <= rs_high:
+            candidates += [np.nextafter(0.1, 0.0), 0.1]
+        values = [self._combine(chi_score, rs) for rs in candidates]
+        return min(values), max(values)
+
+    def triage(self, image: Image.Image, seed=None):
+        """
+        Fast screening pass. Chi-Square only needs the histogram, so it is always
+        computed exactly over the whole image. RS, the expensive part, is estimated
+        from a stratified row sample: its block counts are proportions, so the
+        pooled sample estimates the full-image ratio without depending on pixel count.
+        The 95% interval comes from a leave-one-band-out jackknife of that ratio.
+        """
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        chi_score = self.chi_square_test(image)
+
+        blocks = self._sample_blocks(image, seed=seed)
+        band_counts = np.array([self._rs_counts(np.array(b.convert('L'), dtype=np.int16)) for b in blocks])
+        pooled = band_counts.sum(axis=0)
+        ratio = self._rs_ratio(pooled)
+        rs_score = self._rs_suspicion(ratio)
+
+        n = len(blocks)
+        leave_one_out = [self._rs_ratio(pooled - c) for c in band_counts]
+        if n > 1 and ratio is not None and all(r is not None for r in leave_one_out):
+            leave_one_out = np.array(leave_one_out)
+            se = np.sqrt((n - 1) / n * np.sum((leave_one_out - leave_one_out.mean()) ** 2))
+            margin = t_dist.ppf(0.975, n - 1) * se
+            # Suspicion falls as the ratio rises
+            rs_low = self._rs_suspicion(ratio + margin)
+            rs_high = self._rs_suspicion(max(0.0, ratio - margin))
+        else:
+            rs_low, rs_high = 0.0, 1.0
+
+        suspicion = self._combine(chi_score, rs_score)
+        low, high = self._combined_range(chi_score, rs_low, rs_high)
+
+        sampled_rows = sum(b.size[1] for b in blocks)
+        return {
+            "suspicion_level": float(suspicion),
+            "confidence_interval": [float(min(low, suspicion)), float(max(high, suspicion))],
+            "sample_fraction": sampled_rows / image.size[1],
+            "chi_square_score": float(chi_score),
+            "rs_analysis_score": float(rs_score),
+        }
+
+    def _straddles_threshold(self, interval) -> bool:
+        low, high = interval
+        return any(low <= t <= high for t in DECISION_THRESHOLDS)
+
+    def analyze(self, image: Image.Image, mode: str = "full", seed=None):
+        """
+        Analyzes an image for steganography using Chi-Square and RS Analysis.
+
+        mode:
+            "full"   - run both detectors on the whole image.
+            "triage" - exact Chi-Square, RS estimated from a stratified row sample.
+            "auto"   - triage first, escalate to full analysis when the
+                       confidence interval straddles any of DECISION_THRESHOLDS.
+        The "mode" key of the result reports which path actually ran.
+        """
+        if mode not in ANALYSIS_MODES:
+            raise ValueError(f"Unknown analysis mode: {mode}")
+
+        width, height = image.size
+        triage_result = None
+        if mode == "triage" or (mode == "auto" and width * height >= self.min_triage_pixels):
+            triage_result = self.triage(image, seed=seed)
+            if mode == "triage" or not self._straddles_threshold(triage_result["confidence_interval"]):
+                suspicion = triage_result["suspicion_level"]
+                return {
+                    "suspicion_level": suspicion,
+                    "analysis": self._categorize(suspicion),
+                    "mode": "triage",
+                    "details": {
+                        "chi_square_score": triage_result["chi_square_score"],
+                        "rs_analysis_score": triage_result["rs_analysis_score"],
+                        "confidence_interval": triage_result["confidence_interval"],
+                        "sample_fraction": triage_result["sample_fraction"],
+                    }
+                }
+
+        chi_score = self.chi_square_test(image)
+        rs_score = self.rs_analysis(image)
+        final_suspicion = self._combine(chi_score, rs_score)
+
+        details = {
+            "chi_square_score": float(chi_score),
+            "rs_analysis_score": float(rs_score)
+        }
+        if triage_result is not None:
+            details["triage_confidence_interval"] = triage_result["confidence_interval"]
+
         return {
             "suspicion_level": float(final_suspicion),
-            "analysis": analysis,
-            "details": {
-                "chi_square_score": float(chi_score),
-                "rs_analysis_score": float(rs_score)
-            }
+            "analysis": self._categorize(final_suspicion),
+            "mode": "escalated" if triage_result is not None else "full",
+            "details": details
         }
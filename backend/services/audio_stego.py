@@ -7,6 +7,7 @@ import struct
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
+from services.stego import DEFAULT_CHUNK_SIZE, decode_lsb_bytes, iter_decompressed
 
 class AudioStegoService:
 
@@ -105,8 +106,18 @@ class AudioStegoService:
 
     def extract_data(self, audio_path: str, password: str = None, n_bits: int = 2) -> bytes:
         """Extracts hidden data from multiple LSBs of a WAV file."""
+        chunks = self.extract_stream(audio_path, password=password, n_bits=n_bits)
+        if chunks is None:
+            return None
+        return b"".join(chunks)
+
+    def extract_stream(self, audio_path: str, password: str = None, n_bits: int = 2, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Like extract_data, but returns an iterator of decompressed chunks (or None if
+        no payload is found). The audio file is fully read before returning.
+        """
         data, samplerate = sf.read(audio_path, dtype='int16')
-        flat_audio = data.flatten()
+        flat_audio = data.reshape(-1)
         
         # 1. Extract Header (64 bits)
         len_bits_needed = 64
@@ -115,22 +126,7 @@ class AudioStegoService:
         if len(flat_audio) < samples_for_len:
             return None
             
-        mask = (1 << n_bits) - 1
-        
-        header_samples = flat_audio[:samples_for_len]
-        header_vals = (header_samples & mask).astype(np.uint8)
-        
-        if n_bits == 1:
-            header_bytes = np.packbits(header_vals[:64]).tobytes()
-        elif n_bits == 2:
-            vals = header_vals[:32]
-            header_bytes = ((vals[0::4] << 6) | (vals[1::4] << 4) | (vals[2::4] << 2) | vals[3::4]).tobytes()
-        elif n_bits == 4:
-            vals = header_vals[:16]
-            header_bytes = ((vals[0::2] << 4) | vals[1::2]).tobytes()
-        else:
-            header_bits = np.unpackbits(header_vals.reshape(-1, 1), axis=1)[:, -n_bits:].flatten()
-            header_bytes = np.packbits(header_bits[:64]).tobytes()
+        header_bytes = decode_lsb_bytes(flat_audio, 0, 8, n_bits)
         if header_bytes[:4] != b'STG1':
             return None
             
@@ -144,40 +140,24 @@ class AudioStegoService:
             return None
             
         # 2. Extract Data
-        data_bits_needed = data_len * 8
-        total_bits_needed = 64 + data_bits_needed
+        total_bits_needed = 64 + data_len * 8
         
         total_samples_needed = (total_bits_needed + n_bits - 1) // n_bits
         
         if len(flat_audio) < total_samples_needed:
             return None
-            
-        payload_samples = flat_audio[:total_samples_needed]
-        payload_vals = (payload_samples & mask).astype(np.uint8)
-        
-        # Skip the header portion (64 bits = 64/n_bits elements)
-        header_elements = 64 // n_bits
-        payload_data_vals = payload_vals[header_elements : header_elements + (data_bits_needed // n_bits)]
-        
-        if n_bits == 1:
-            extracted_data = np.packbits(payload_data_vals).tobytes()
-        elif n_bits == 2:
-            extracted_data = ((payload_data_vals[0::4] << 6) | (payload_data_vals[1::4] << 4) | 
-                              (payload_data_vals[2::4] << 2) | payload_data_vals[3::4]).tobytes()
-        elif n_bits == 4:
-            extracted_data = ((payload_data_vals[0::2] << 4) | payload_data_vals[1::2]).tobytes()
-        else:
-            all_bits = np.unpackbits(payload_vals.reshape(-1, 1), axis=1)[:, -n_bits:].flatten()
-            payload_bits = all_bits[64 : 64 + data_bits_needed]
-            extracted_data = np.packbits(payload_bits).tobytes()
         
         if password:
+            # AES-GCM must see the whole ciphertext before any plaintext is released
             try:
-                extracted_data = self.decrypt(extracted_data, password)
+                decrypted = self.decrypt(decode_lsb_bytes(flat_audio, 64, data_len, n_bits), password)
             except Exception as e:
                 raise ValueError(f"Decryption failed: {str(e)}")
+            chunks = (decrypted[i : i + chunk_size] for i in range(0, len(decrypted), chunk_size))
+        else:
+            chunks = (
+                decode_lsb_bytes(flat_audio, 64 + i * 8, min(chunk_size, data_len - i), n_bits)
+                for i in range(0, data_len, chunk_size)
+            )
         
-        try:
-            return zlib.decompress(extracted_data)
-        except Exception:
-            return extracted_data
+        return iter_decompressed(chunks, chunk_size)
@@ -0,0 +1,152 @@
+import os
+import struct
+import hashlib
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile as sf
+from PIL import Image
+
+from services.stego import StegoService
+from services.audio_stego import AudioStegoService
+
+# Shard header: signature, payload id, shard index, shard count, secret length, secret SHA-256
+SHARD_SIGNATURE = b'SHD1'
+SHARD_HEADER = struct.Struct('>4s16sHHQ32s')
+
+AUDIO_EXTENSIONS = ('.wav', '.flac')
+
+class ShardCapacityError(ValueError):
+    """The secret does not fit in the combined capacity of the carriers."""
+
+class ShardSetError(ValueError):
+    """The provided files are not a complete, consistent and intact set of shards."""
+
+class ShardingService:
+    """
+    Splits one secret across several carriers (images or audio files).
+    The secret is compressed once and the compressed stream is divided in
+    proportion to each carrier's capacity, so nothing is ever tiled. Each
+    shard carries a header identifying its payload, position and the SHA-256
+    of the whole secret, which is checked on reassembly.
+    Carriers are embedded and extracted in parallel.
+    """
+
+    def __init__(self, stego_service: StegoService = None, audio_stego_service: AudioStegoService = None, max_workers: int = None):
+        self.stego_service = stego_service or StegoService()
+        self.audio_stego_service = audio_stego_service or AudioStegoService()
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def _is_audio(self, path: str) -> bool:
+        return path.lower().endswith(AUDIO_EXTENSIONS)
+
+    def capacity(self, path: str, password: str = None, n_bits: int = 2) -> int:
+        """Bytes of compressed secret a carrier can hold as a shard, read from its header only."""
+        if self._is_audio(path):
+            info = sf.info(path)
+            elements = info.frames * info.channels
+        else:
+            with Image.open(path) as img:
+                width, height = img.size
+            elements = width * height * 3
+
+        raw = (elements * n_bits) // 8 - 8 - SHARD_HEADER.size
+        if password:
+            raw -= 16 + 12 + 16 # salt + nonce + GCM tag
+        # hide_data compresses again; leave room for zlib's overhead on incompressible data
+        raw -= 16 + 5 * (raw // 16384 + 1)
+        return max(0, raw)
+
+    def split(self, secret: bytes, capacities: list) -> list:
+        """Builds shard payloads (header + slice of the compressed secret) for the given capacities."""
+        compressed = zlib.compress(secret)
+        total_capacity = sum(capacities)
+        if len(compressed) > total_capacity:
+            raise ShardCapacityError(f"Secret needs {len(compressed)} bytes but carriers only hold {total_capacity}")
+
+        payload_id = os.urandom(16)
+        digest = hashlib.sha256(secret).digest()
+        total = len(capacities)
+
+        shards = []
+        offset = 0
+        remaining_capacity = total_capacity
+        for index, cap in enumerate(capacities):
+            remaining = len(compressed) - offset
+            # Proportional share, rounded up so the last carriers aren't overfilled
+            share = min(cap, -(-remaining * cap // remaining_capacity)) if remaining_capacity else 0
+            header = SHARD_HEADER.pack(SHARD_SIGNATURE, payload_id, index, total, len(secret), digest)
+            shards.append(header + compressed[offset : offset + share])
+            offset += share
+            remaining_capacity -= cap
+        return shards
+
+    def _hide_one(self, carrier_path: str, shard: bytes, output_path: str, password: str, n_bits: int) -> str:
+        if self._is_audio(carrier_path):
+            return self.audio_stego_service.hide_data(carrier_path, shard, output_path, password=password, n_bits=n_bits)
+        with Image.open(carrier_path) as img:
+            stego_img = self.stego_service.hide_data(img.convert("RGB"), shard, password, n_bits=n_bits)
+        stego_img.save(output_path, format="PNG")
+        return output_path
+
+    def hide_sharded(self, carrier_paths: list, secret: bytes, output_paths: list, password: str = None, n_bits: int = 2) -> list:
+        """
+        Embeds one shard of the secret into each carrier and writes the stego files
+        to output_paths (PNG for images, WAV for audio). Returns the output paths.
+        """
+        capacities = [self.capacity(p, password, n_bits) for p in carrier_paths]
+        shards = self.split(secret, capacities)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(shards))) as pool:
+            futures = [
+                pool.submit(self._hide_one, carrier, shard, output, password, n_bits)
+                for carrier, shard, output in zip(carrier_paths, shards, output_paths)
+            ]
+            return [f.result() for f in futures]
+
+    def _extract_one(self, stego_path: str, password: str, n_bits: int) -> bytes:
+        try:
+            if self._is_audio(stego_path):
+                return self.audio_stego_service.extract_data(stego_path, password=password, n_bits=n_bits)
+            with Image.open(stego_path) as img:
+                return self.stego_service.extract_data(img.convert("RGB"), password, n_bits=n_bits)
+        except ValueError as e:
+            # Decryption and decompression failures mean bad input, not a server fault
+            raise ShardSetError("Could not read shard: wrong password or damaged file") from e
+
+    def extract_sharded(self, stego_paths: list, password: str = None, n_bits: int = 2) -> bytes:
+        """Extracts shards from the stego files (in any order), reassembles and verifies the secret."""
+        if not stego_paths:
+            raise ShardSetError("No shards provided")
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(stego_paths))) as pool:
+            extracted = list(pool.map(lambda p: self._extract_one(p, password, n_bits), stego_paths))
+
+        shards = {}
+        meta = None
+        for data in extracted:
+            if not data or len(data) < SHARD_HEADER.size:
+                raise ShardSetError("File does not contain a shard")
+            signature, payload_id, index, total, secret_len, digest = SHARD_HEADER.unpack_from(data)
+            if signature != SHARD_SIGNATURE:
+                raise ShardSetError("File does not contain a shard")
+            if meta is None:
+                meta = (payload_id, total, secret_len, digest)
+            elif meta != (payload_id, total, secret_len, digest):
+                raise ShardSetError("Shards belong to different payloads")
+            if index in shards:
+                raise ShardSetError(f"Duplicate shard {index}")
+            shards[index] = data[SHARD_HEADER.size:]
+
+        payload_id, total, secret_len, digest = meta
+        missing = sorted(set(range(total)) - set(shards))
+        if missing:
+            raise ShardSetError(f"Missing shards: {missing}")
+
+        try:
+            secret = zlib.decompress(b"".join(shards[i] for i in range(total)))
+        except zlib.error:
+            raise ShardSetError("Reassembled payload failed integrity check")
+        if len(secret) != secret_len or hashlib.sha256(secret).digest() != digest:
+            raise ShardSetError("Reassembled payload failed integrity check")
+        return secret
@@ -9,6 +9,62 @@ import os
 import base64
 import zlib
 
+DEFAULT_CHUNK_SIZE = 1024 * 1024 # 1MB
+
+def decode_lsb_bytes(flat: np.ndarray, start_bit: int, nbytes: int, n_bits: int) -> bytes:
+    """Reassembles nbytes hidden in the n_bits LSBs of flat, starting at bit offset start_bit."""
+    mask = (1 << n_bits) - 1
+    if n_bits in (1, 2, 4):
+        start = start_bit // n_bits
+        vals = (flat[start : start + (nbytes * 8) // n_bits] & mask).astype(np.uint8)
+        if n_bits == 1:
+            return np.packbits(vals).tobytes()
+        elif n_bits == 2:
+            return ((vals[0::4] << 6) | (vals[1::4] << 4) | (vals[2::4] << 2) | vals[3::4]).tobytes()
+        else:
+            return ((vals[0::2] << 4) | vals[1::2]).tobytes()
+
+    first = start_bit // n_bits
+    last = (start_bit + nbytes * 8 + n_bits - 1) // n_bits
+    vals = (flat[first:last] & mask).astype(np.uint8)
+    bits = np.unpackbits(vals.reshape(-1, 1), axis=1)[:, -n_bits:].flatten()
+    offset = start_bit - first * n_bits
+    return np.packbits(bits[offset : offset + nbytes * 8]).tobytes()
+
+def iter_decompressed(chunks, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Incrementally inflates a zlib stream, yielding at most chunk_size bytes at a time.
+    Data that doesn't start as a zlib stream is passed through unchanged.
+    """
+    chunks = iter(chunks)
+    first = next(chunks, b"")
+    if not first:
+        return
+    d = zlib.decompressobj()
+    try:
+        out = d.decompress(first, chunk_size)
+    except zlib.error:
+        yield first
+        yield from chunks
+        return
+
+    while True:
+        if out:
+            yield out
+        if d.unconsumed_tail:
+            out = d.decompress(d.unconsumed_tail, chunk_size)
+            continue
+        chunk = next(chunks, None)
+        if chunk is None:
+            break
+        out = d.decompress(chunk, chunk_size)
+
+    tail = d.flush()
+    if tail:
+        yield tail
+    if not d.eof:
+        raise ValueError("Compressed payload is truncated")
+
 class StegoService:
 
     def __init__(self):
@@ -95,11 +151,22 @@ class StegoService:
 
     def extract_data(self, stego_image: Image.Image, password: str = None, n_bits: int = 1) -> bytes:
         """Extracts hidden data from multiple LSBs of an image."""
+        chunks = self.extract_stream(stego_image, password, n_bits=n_bits)
+        if chunks is None:
+            return None
+        return b"".join(chunks)
+
+    def extract_stream(self, stego_image: Image.Image, password: str = None, n_bits: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Like extract_data, but returns an iterator of decompressed chunks (or None if
+        no payload is found). The header is checked, and encrypted payloads are
+        authenticated, before returning so errors surface before any data is produced.
+        """
         if stego_image.mode != 'RGB':
             stego_image = stego_image.convert('RGB')
             
         img_array = np.array(stego_image)
-        flat_img = img_array.flatten()
+        flat_img = img_array.reshape(-1)
         
         # 1. Extract Header (64 bits)
         len_bits_needed = 64
@@ -108,23 +175,7 @@ class StegoService:
         if len(flat_img) < pixels_for_len:
              return None
 
-        mask = (1 << n_bits) - 1
-        
-        # Extract header pixels
-        header_pixels = flat_img[:pixels_for_len]
-        header_vals = (header_pixels & mask).astype(np.uint8)
-        
-        if n_bits == 1:
-            header_bytes = np.packbits(header_vals[:64]).tobytes()
-        elif n_bits == 2:
-            vals = header_vals[:32]
-            header_bytes = ((vals[0::4] << 6) | (vals[1::4] << 4) | (vals[2::4] << 2) | vals[3::4]).tobytes()
-        elif n_bits == 4:
-            vals = header_vals[:16]
-            header_bytes = ((vals[0::2] << 4) | vals[1::2]).tobytes()
-        else:
-            header_bits = np.unpackbits(header_vals.reshape(-1, 1), axis=1)[:, -n_bits:].flatten()
-            header_bytes = np.packbits(header_bits[:64]).tobytes()
+        header_bytes = decode_lsb_bytes(flat_img, 0, 8, n_bits)
         if header_bytes[:4] != b'STG1':
             return None
             
@@ -140,8 +191,7 @@ class StegoService:
             
         # 2. Extract Data
         # Total bits needed = (64 bits for header) + (data_len * 8 bits for payload)
-        data_bits_needed = data_len * 8
-        total_bits_needed = 64 + data_bits_needed
+        total_bits_needed = 64 + data_len * 8
         
         # Calculate total pixels required to store everything
         total_pixels_needed = (total_bits_needed + n_bits - 1) // n_bits
@@ -149,34 +199,18 @@ class StegoService:
         if len(flat_img) < total_pixels_needed:
             # File might be truncated or not contain our data
             return None
-            
-        # Extract all needed pixels
-        payload_pixels = flat_img[:total_pixels_needed]
-        payload_vals = (payload_pixels & mask).astype(np.uint8)
-        
-        # Skip the header portion (64 bits = 64/n_bits elements)
-        header_elements = 64 // n_bits
-        payload_data_vals = payload_vals[header_elements : header_elements + (data_bits_needed // n_bits)]
-        
-        if n_bits == 1:
-            extracted_data = np.packbits(payload_data_vals).tobytes()
-        elif n_bits == 2:
-            extracted_data = ((payload_data_vals[0::4] << 6) | (payload_data_vals[1::4] << 4) | 
-                              (payload_data_vals[2::4] << 2) | payload_data_vals[3::4]).tobytes()
-        elif n_bits == 4:
-            extracted_data = ((payload_data_vals[0::2] << 4) | payload_data_vals[1::2]).tobytes()
-        else:
-            all_bits = np.unpackbits(payload_vals.reshape(-1, 1), axis=1)[:, -n_bits:].flatten()
-            payload_bits = all_bits[64 : 64 + data_bits_needed]
-            extracted_data = np.packbits(payload_bits).tobytes()
         
         if password:
+            # AES-GCM must see the whole ciphertext before any plaintext is released
             try:
-                extracted_data = self.decrypt(extracted_data, password)
+                decrypted = self.decrypt(decode_lsb_bytes(flat_img, 64, data_len, n_bits), password)
             except Exception as e:
                 raise ValueError(f"Decryption failed: {str(e)}")
+            chunks = (decrypted[i : i + chunk_size] for i in range(0, len(decrypted), chunk_size))
+        else:
+            chunks = (
+                decode_lsb_bytes(flat_img, 64 + i * 8, min(chunk_size, data_len - i), n_bits)
+                for i in range(0, data_len, chunk_size)
+            )
         
-        try:
-            return zlib.decompress(extracted_data)
-        except Exception:
-            return extracted_data
+        return iter_decompressed(chunks, chunk_size)
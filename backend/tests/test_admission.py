@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from services.admission import AdmissionController, AdmissionRejected
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def hold(controller, nbytes, started: asyncio.Event, release: asyncio.Event):
+    async with controller.reserve(nbytes):
+        started.set()
+        await release.wait()
+
+def test_admits_immediately_within_budget():
+    async def scenario():
+        controller = AdmissionController(100)
+        async with controller.reserve(60):
+            async with controller.reserve(40):
+                assert controller.stats()["in_use_bytes"] == 100
+        assert controller.stats()["in_use_bytes"] == 0
+        assert controller.stats()["admitted"] == 2
+
+    run(scenario())
+
+def test_waiter_is_admitted_when_memory_is_released():
+    async def scenario():
+        controller = AdmissionController(100, small_request_bytes=10)
+        started, release = asyncio.Event(), asyncio.Event()
+        first = asyncio.create_task(hold(controller, 80, started, release))
+        await started.wait()
+
+        second_started = asyncio.Event()
+        second = asyncio.create_task(hold(controller, 50, second_started, asyncio.Event()))
+        await asyncio.sleep(0.01)
+        assert controller.stats()["slow_lane_depth"] == 1
+        assert not second_started.is_set()
+
+        release.set()
+        await first
+        await asyncio.wait_for(second_started.wait(), 1)
+        assert controller.stats()["in_use_bytes"] == 50
+        second.cancel()
+
+    run(scenario())
+
+def test_small_request_bypasses_queued_large_ones():
+    async def scenario():
+        controller = AdmissionController(100, max_queue=2, small_request_bytes=10, queue_timeout=1)
+        started, release = asyncio.Event(), asyncio.Event()
+        running = asyncio.create_task(hold(controller, 98, started, release))
+        await started.wait()
+        waiting = [asyncio.create_task(hold(controller, 90, asyncio.Event(), release)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert controller.stats()["slow_lane_depth"] == 2
+
+        # Slow lane is full, but a small request has its own lane and fits now
+        async with controller.reserve(2):
+            pass
+
+        release.set()
+        await asyncio.gather(running, *waiting)
+
+    run(scenario())
+
+def test_full_lane_is_rejected_with_retry_after():
+    async def scenario():
+        controller = AdmissionController(100, max_queue=1, small_request_bytes=10, queue_timeout=1)
+        started, release = asyncio.Event(), asyncio.Event()
+        running = asyncio.create_task(hold(controller, 100, started, release))
+        await started.wait()
+        queued = asyncio.create_task(hold(controller, 50, asyncio.Event(), release))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(AdmissionRejected) as exc:
+            async with controller.reserve(50):
+                pass
+        assert exc.value.retry_after >= 1
+        assert controller.stats()["rejected"] == 1
+
+        release.set()
+        await asyncio.gather(running, queued)
+
+    run(scenario())
+
+def test_timeout_rejects_and_frees_the_queue_slot():
+    async def scenario():
+        controller = AdmissionController(100, small_request_bytes=10, queue_timeout=0.05)
+        started, release = asyncio.Event(), asyncio.Event()
+        running = asyncio.create_task(hold(controller, 100, started, release))
+        await started.wait()
+
+        with pytest.raises(AdmissionRejected):
+            async with controller.reserve(50):
+                pass
+        assert controller.stats()["queue_depth"] == 0
+
+        release.set()
+        await running
+        assert controller.stats()["in_use_bytes"] == 0
+
+    run(scenario())
+
+def test_cancelled_waiter_leaves_no_reservation():
+    async def scenario():
+        controller = AdmissionController(100, small_request_bytes=10)
+        started, release = asyncio.Event(), asyncio.Event()
+        running = asyncio.create_task(hold(controller, 100, started, release))
+        await started.wait()
+
+        waiter = asyncio.create_task(hold(controller, 50, asyncio.Event(), asyncio.Event()))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        release.set()
+        await running
+        stats = controller.stats()
+        assert stats["queue_depth"] == 0
+        assert stats["in_use_bytes"] == 0
+
+    run(scenario())
+
+def test_oversized_request_runs_alone():
+    async def scenario():
+        controller = AdmissionController(100)
+        async with controller.reserve(10_000):
+            assert controller.stats()["in_use_bytes"] == 100
+
+    run(scenario())
+
+def test_starving_large_request_blocks_new_small_ones():
+    async def scenario():
+        controller = AdmissionController(100, small_request_bytes=10, queue_timeout=2, max_slow_wait=0.05)
+        started, release = asyncio.Event(), asyncio.Event()
+        small = asyncio.create_task(hold(controller, 10, started, release))
+        await started.wait()
+
+        large_started = asyncio.Event()
+        large = asyncio.create_task(hold(controller, 500, large_started, asyncio.Event()))
+        await asyncio.sleep(0.1)
+        assert controller.stats()["slow_lane_starving"]
+
+        # Fits in the budget, but must wait behind the starving large request
+        late_started = asyncio.Event()
+        late = asyncio.create_task(hold(controller, 10, late_started, asyncio.Event()))
+        await asyncio.sleep(0.01)
+        assert not late_started.is_set()
+
+        release.set()
+        await small
+        await asyncio.wait_for(large_started.wait(), 1)
+        assert not late_started.is_set()
+        large.cancel()
+        await asyncio.wait_for(late_started.wait(), 1)
+        late.cancel()
+
+    run(scenario())
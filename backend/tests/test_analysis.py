@@ -0,0 +1,106 @@
+import io
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from scipy.stats import chisquare
+
+from app import app
+from services.analysis import DECISION_THRESHOLDS, SteganalysisService
+from services.stego import StegoService
+
+def reference_chi_square(image):
+    """Per-channel np.bincount chi-square, as analyze() computed it before triage existed."""
+    arr = np.array(image.convert("RGB"))
+    scores = []
+    for c in range(3):
+        counts = np.bincount(arr[:, :, c].ravel(), minlength=256)
+        obs, exp = [], []
+        for i in range(0, 256, 2):
+            if counts[i] + counts[i + 1] > 20:
+                avg = (counts[i] + counts[i + 1]) / 2
+                obs.extend([counts[i], counts[i + 1]])
+                exp.extend([avg, avg])
+        scores.append(chisquare(obs, f_exp=exp)[1] if len(obs) > 20 else 0.0)
+    return max(scores)
+
+def reference_rs(image):
+    img = np.array(image.convert("L"), dtype=np.int16)
+    cols = img.shape[1] // 2
+    x, y = img[:, 0:2 * cols:2], img[:, 1:2 * cols:2]
+    d_0 = np.abs(x - y)
+    d_f1 = np.abs(x - (y ^ 1))
+    d_fm1 = np.abs(x - (y + (y & 1) * 2 - 1))
+    valid = (d_0 > 0) | (d_f1 > 0)
+    n = valid.sum()
+    diff_m = abs(np.sum((d_f1 > d_0) & valid) - np.sum((d_f1 < d_0) & valid)) / n
+    diff_neg = abs(np.sum((d_fm1 > d_0) & valid) - np.sum((d_fm1 < d_0) & valid)) / n
+    ratio = diff_m / diff_neg
+    if ratio > 0.85:
+        return 0.0
+    return float(max(0.0, min(1.0, 1.0 - (ratio - 0.2) / 0.65)))
+
+def photo(noise=2.0, seed=0, height=400, width=600):
+    """Smooth gradients plus Gaussian sensor-like noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 0.3 + y * 0.1, x * 0.1 + np.sin(y / 20) * 40 + 100, y * 0.4], axis=-1)
+    return Image.fromarray((base + rng.normal(0, noise, base.shape)).clip(0, 255).astype(np.uint8))
+
+@pytest.fixture
+def images():
+    clean = photo()
+    stego = StegoService().hide_data(clean, np.random.default_rng(1).bytes(80_000), None, n_bits=1)
+    return {"clean": clean, "stego": stego, "noisy": photo(noise=6, seed=2)}
+
+@pytest.mark.parametrize("name", ["clean", "stego", "noisy"])
+def test_full_mode_matches_reference(images, name):
+    image = images[name]
+    service = SteganalysisService()
+    result = service.analyze(image)
+
+    assert result["mode"] == "full"
+    assert result["details"]["chi_square_score"] == pytest.approx(reference_chi_square(image), abs=1e-12)
+    assert result["details"]["rs_analysis_score"] == pytest.approx(reference_rs(image), abs=1e-12)
+
+def test_triage_is_reproducible(images):
+    service = SteganalysisService()
+    image = images["stego"]
+
+    assert service.triage(image) == service.triage(image.copy())
+    assert service.triage(image, seed=7) == service.triage(image, seed=7)
+
+def test_auto_stays_on_triage_when_interval_is_clear(images):
+    service = SteganalysisService(min_triage_pixels=0)
+    result = service.analyze(images["clean"], mode="auto")
+
+    low, high = result["details"]["confidence_interval"]
+    assert not any(low <= t <= high for t in DECISION_THRESHOLDS)
+    assert result["mode"] == "triage"
+
+def test_auto_escalates_when_interval_straddles_a_threshold(images):
+    # Heavy noise makes the sampled RS ratio vary a lot between bands
+    service = SteganalysisService(min_triage_pixels=0)
+    interval = service.triage(images["noisy"])["confidence_interval"]
+    assert any(interval[0] <= t <= interval[1] for t in DECISION_THRESHOLDS)
+
+    result = service.analyze(images["noisy"], mode="auto")
+    assert result["mode"] == "escalated"
+    assert result["details"]["triage_confidence_interval"] == interval
+    assert result["suspicion_level"] == service.analyze(images["noisy"])["suspicion_level"]
+
+def test_auto_runs_full_below_min_triage_pixels(images):
+    service = SteganalysisService(min_triage_pixels=10_000_000)
+    assert service.analyze(images["clean"], mode="auto")["mode"] == "full"
+
+def test_unknown_mode_is_rejected(images):
+    with pytest.raises(ValueError):
+        SteganalysisService().analyze(images["clean"], mode="quick")
+
+    buffer = io.BytesIO()
+    images["clean"].save(buffer, format="PNG")
+    response = TestClient(app).post(
+        "/analyze", files={"file": ("clean.png", buffer.getvalue(), "image/png")}, data={"mode": "quick"}
+    )
+    assert response.status_code == 400
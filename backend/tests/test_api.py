@@ -0,0 +1,140 @@
+import asyncio
+import io
+import zipfile
+from contextlib import AsyncExitStack
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import app as api
+from services.admission import AdmissionController
+
+client = TestClient(api.app)
+
+def png_bytes(height=40, width=60, seed=0) -> bytes:
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+@pytest.fixture
+def saturated(monkeypatch):
+    """An admission controller with no budget and no queue: every reservation is rejected with 503."""
+    monkeypatch.setattr(api, "admission", AdmissionController(0, max_queue=0, max_fast_queue=0))
+
+def test_saturated_controller_rejects_valid_requests(saturated):
+    response = client.post("/analyze", files={"file": ("a.png", png_bytes(), "image/png")})
+    assert response.status_code == 503
+
+@pytest.mark.parametrize("path, files, data, status", [
+    ("/hide", {"carrier_file": ("a.txt", b"hello", "text/plain")}, {"secret_text": "x"}, 400),
+    ("/hide", {"carrier_file": ("a.png", png_bytes(), "image/png")}, {}, 400),
+    ("/extract", {"stego_file": ("a.txt", b"hello", "text/plain")}, {}, 400),
+    ("/hide/sharded", {"carrier_files": ("a.png", png_bytes(), "image/png")}, {}, 400),
+    ("/extract/sharded", {"stego_files": ("a.txt", b"hello", "text/plain")}, {}, 400),
+])
+def test_invalid_requests_are_rejected_before_admission(saturated, path, files, data, status):
+    response = client.post(path, files=files, data=data)
+    assert response.status_code == status
+
+def test_oversized_uploads_are_rejected_before_admission(saturated, monkeypatch):
+    monkeypatch.setattr(api, "MAX_FILE_SIZE_STEGANOGRAPHY", 10)
+    monkeypatch.setattr(api, "MAX_FILE_SIZE_STEGANALYSIS", 10)
+    image = ("a.png", png_bytes(), "image/png")
+
+    assert client.post("/hide", files={"carrier_file": image}, data={"secret_text": "x"}).status_code == 413
+    assert client.post("/extract", files={"stego_file": image}).status_code == 413
+    assert client.post("/analyze", files={"file": image}).status_code == 413
+    assert client.post("/hide/sharded", files={"carrier_files": image}, data={"secret_text": "x"}).status_code == 413
+    assert client.post("/extract/sharded", files={"stego_files": image}).status_code == 413
+
+def test_analyze_non_image_skips_admission(saturated):
+    response = client.post("/analyze", files={"file": ("a.wav", b"RIFF", "audio/wav")})
+    assert response.status_code == 200
+    assert "only supported for images" in response.json()["message"]
+
+def stego_png(secret: bytes, height=300, width=400) -> bytes:
+    rng = np.random.default_rng(1)
+    carrier = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    buffer = io.BytesIO()
+    api.stego_service.hide_data(carrier, secret, None, n_bits=2).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def extract(image: bytes):
+    return client.post("/extract", files={"stego_file": ("stego.png", image, "image/png")})
+
+def test_extract_small_text_returns_json():
+    response = extract(stego_png("héllo wörld".encode()))
+    assert response.status_code == 200
+    assert response.json() == {"type": "text", "content": "héllo wörld"}
+
+def test_extract_large_text_is_streamed():
+    secret = ("lorem ipsum dolor sit amet ✓ " * 50_000).encode()
+    assert len(secret) > api.TEXT_RESPONSE_MAX_BYTES
+
+    response = extract(stego_png(secret))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'filename="extracted_data.txt"' in response.headers["content-disposition"]
+    assert response.content == secret
+
+def test_extract_binary_uses_guessed_type_and_filename():
+    secret = png_bytes(height=20, width=20)
+    response = extract(stego_png(secret))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert 'filename="extracted_data.png"' in response.headers["content-disposition"]
+    assert response.content == secret
+
+def test_extract_without_payload_returns_404():
+    assert extract(png_bytes()).status_code == 404
+
+def test_streamed_extraction_releases_its_reservation(monkeypatch):
+    monkeypatch.setattr(api, "admission", AdmissionController(1024 ** 3))
+    response = extract(stego_png(("x" * 64 + "\n").encode() * 20_000))
+    assert response.headers["content-type"].startswith("text/plain")
+
+    stats = client.get("/metrics/admission").json()
+    assert stats["in_use_bytes"] == 0
+    assert stats["admitted"] == 1
+
+def test_extraction_buffers_no_more_than_the_text_limit():
+    size = api.TEXT_RESPONSE_MAX_BYTES
+    consumed = []
+
+    def chunks():
+        for i in range(3):
+            consumed.append(i)
+            yield b"a" * size
+
+    async def scenario():
+        async with AsyncExitStack() as hold:
+            stream = chunks()
+            response = await api.build_extraction_response(stream, hold)
+            assert consumed == [0]
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            assert len(body) == 3 * size
+
+    asyncio.run(scenario())
+
+def test_sharded_extract_with_wrong_password_returns_400():
+    carriers = [("a.png", png_bytes(200, 200, seed=1), "image/png"), ("b.png", png_bytes(200, 200, seed=2), "image/png")]
+    hidden = client.post(
+        "/hide/sharded",
+        files=[("carrier_files", c) for c in carriers],
+        data={"secret_text": "attack at dawn", "password": "secret"},
+    )
+    assert hidden.status_code == 200
+
+    with zipfile.ZipFile(io.BytesIO(hidden.content)) as archive:
+        shards = [(name, archive.read(name), "image/png") for name in archive.namelist()]
+    files = [("stego_files", shard) for shard in shards]
+
+    response = client.post("/extract/sharded", files=files, data={"password": "guess"})
+    assert response.status_code == 400
+    assert "wrong password" in response.json()["detail"]
+
+    response = client.post("/extract/sharded", files=files, data={"password": "secret"})
+    assert response.json() == {"type": "text", "content": "attack at dawn"}
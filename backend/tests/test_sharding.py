@@ -0,0 +1,112 @@
+import os
+import random
+import zlib
+
+import numpy as np
+import pytest
+import soundfile as sf
+from PIL import Image
+
+from services.sharding import SHARD_HEADER, ShardingService, ShardCapacityError, ShardSetError
+
+@pytest.fixture
+def service():
+    return ShardingService(max_workers=2)
+
+def reassemble(shards):
+    """Concatenates split() output in index order and inflates it."""
+    ordered = sorted(shards, key=lambda s: SHARD_HEADER.unpack_from(s)[2])
+    return zlib.decompress(b"".join(s[SHARD_HEADER.size:] for s in ordered))
+
+def test_split_is_proportional_and_within_capacity(service):
+    secret = os.urandom(30_000)
+    capacities = [10_000, 20_000, 5_000]
+    shards = service.split(secret, capacities)
+
+    assert len(shards) == 3
+    for shard, cap in zip(shards, capacities):
+        assert len(shard) - SHARD_HEADER.size <= cap
+    assert reassemble(shards) == secret
+
+def test_split_tiny_secret_leaves_some_shards_empty(service):
+    # More carriers than compressed bytes: the tail carriers get nothing
+    secret = b"hi"
+    shards = service.split(secret, [10_000] * 20)
+
+    sizes = [len(s) - SHARD_HEADER.size for s in shards]
+    assert 0 in sizes
+    assert sum(sizes) == len(zlib.compress(secret))
+    assert reassemble(shards) == secret
+
+def test_split_zero_capacity_carrier_gets_no_data(service):
+    shards = service.split(b"payload" * 100, [0, 5_000])
+    assert len(shards[0]) == SHARD_HEADER.size
+    assert reassemble(shards) == b"payload" * 100
+
+def test_split_rejects_secret_over_capacity(service):
+    with pytest.raises(ShardCapacityError):
+        service.split(os.urandom(10_000), [1_000, 1_000])
+
+def test_headers_share_payload_id_and_count(service):
+    shards = service.split(os.urandom(5_000), [4_000, 4_000])
+    headers = [SHARD_HEADER.unpack_from(s) for s in shards]
+    assert {h[1] for h in headers} == {headers[0][1]}
+    assert [h[2] for h in headers] == [0, 1]
+    assert {h[3] for h in headers} == {2}
+
+@pytest.fixture
+def carriers(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i, (h, w) in enumerate([(120, 160), (200, 100), (60, 80)]):
+        path = str(tmp_path / f"carrier_{i}.png")
+        Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+    path = str(tmp_path / "carrier.wav")
+    sf.write(path, rng.integers(-2000, 2000, (8000, 2), dtype=np.int16), 8000, subtype="PCM_16")
+    paths.append(path)
+    return paths
+
+def hide(service, carriers, tmp_path, secret, password=None):
+    outputs = [str(tmp_path / f"stego_{i}{os.path.splitext(c)[1]}") for i, c in enumerate(carriers)]
+    service.hide_sharded(carriers, secret, outputs, password=password)
+    return outputs
+
+@pytest.mark.parametrize("password", [None, "secret"])
+def test_round_trip_in_shuffled_order(service, carriers, tmp_path, password):
+    secret = os.urandom(20_000)
+    outputs = hide(service, carriers, tmp_path, secret, password)
+
+    random.Random(1).shuffle(outputs)
+    assert service.extract_sharded(outputs, password=password) == secret
+
+def test_round_trip_with_empty_shards(service, carriers, tmp_path):
+    outputs = hide(service, carriers, tmp_path, b"x")
+    assert service.extract_sharded(outputs[::-1]) == b"x"
+
+def test_missing_shard_is_rejected(service, carriers, tmp_path):
+    outputs = hide(service, carriers, tmp_path, os.urandom(5_000))
+    with pytest.raises(ShardSetError, match="Missing shards"):
+        service.extract_sharded(outputs[1:])
+
+def test_duplicate_shard_is_rejected(service, carriers, tmp_path):
+    outputs = hide(service, carriers, tmp_path, os.urandom(5_000))
+    with pytest.raises(ShardSetError, match="Duplicate"):
+        service.extract_sharded(outputs + outputs[:1])
+
+def test_shards_from_different_payloads_are_rejected(service, carriers, tmp_path):
+    first = hide(service, carriers, tmp_path, os.urandom(5_000))
+    other_dir = tmp_path / "other"
+    other_dir.mkdir()
+    second = hide(service, carriers, other_dir, os.urandom(5_000))
+    with pytest.raises(ShardSetError, match="different payloads"):
+        service.extract_sharded([first[0], second[1], first[2], first[3]])
+
+def test_plain_carrier_is_not_a_shard(service, carriers):
+    with pytest.raises(ShardSetError, match="does not contain a shard"):
+        service.extract_sharded(carriers)
+
+def test_wrong_password_is_rejected(service, carriers, tmp_path):
+    outputs = hide(service, carriers, tmp_path, os.urandom(5_000), password="secret")
+    with pytest.raises(ShardSetError, match="wrong password"):
+        service.extract_sharded(outputs, password="guess")
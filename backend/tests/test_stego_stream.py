@@ -0,0 +1,52 @@
+import os
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from services.stego import StegoService, iter_decompressed
+
+def chunked(data: bytes, size: int):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+def test_iter_decompressed_round_trip_with_bounded_chunks():
+    secret = os.urandom(50_000) + b"a" * 200_000
+    chunks = list(iter_decompressed(chunked(zlib.compress(secret), 1000), chunk_size=4096))
+    assert b"".join(chunks) == secret
+    assert max(len(c) for c in chunks) <= 4096
+
+def test_iter_decompressed_single_input_chunk_is_split():
+    # A highly compressible payload expands far beyond one input chunk
+    secret = b"x" * 1_000_000
+    chunks = list(iter_decompressed([zlib.compress(secret)], chunk_size=65536))
+    assert b"".join(chunks) == secret
+    assert len(chunks) > 1
+
+def test_iter_decompressed_passes_through_non_zlib_data():
+    raw = [b"not zlib data", b" and more"]
+    assert list(iter_decompressed(raw)) == raw
+
+def test_iter_decompressed_empty_input():
+    assert list(iter_decompressed([])) == []
+
+def test_iter_decompressed_truncated_stream_raises():
+    compressed = zlib.compress(os.urandom(10_000))
+    with pytest.raises(ValueError):
+        list(iter_decompressed([compressed[:-50]]))
+
+@pytest.mark.parametrize("n_bits", [1, 2, 3, 4, 7])
+@pytest.mark.parametrize("password", [None, "secret"])
+def test_extract_stream_matches_extract_data(n_bits, password):
+    rng = np.random.default_rng(n_bits)
+    carrier = Image.fromarray(rng.integers(0, 256, (200, 300, 3), dtype=np.uint8))
+    secret = rng.bytes(5000) + b"z" * 20_000
+    service = StegoService()
+    stego = service.hide_data(carrier, secret, password, n_bits=n_bits)
+
+    assert b"".join(service.extract_stream(stego, password, n_bits=n_bits, chunk_size=777)) == secret
+    assert service.extract_data(stego, password, n_bits=n_bits) == secret
+
+def test_extract_stream_without_payload_returns_none():
+    carrier = Image.new("RGB", (50, 50), (10, 20, 30))
+    assert StegoService().extract_stream(carrier, None, n_bits=2) is None
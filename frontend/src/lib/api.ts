@@ -52,13 +52,18 @@ export const api = {
     if (contentType?.includes("application/json")) {
       return response.json(); // Likely { type: "text", content: "..." } or error
     } else {
-      return response.blob(); // Binary file
+      // Binary file or large text payload; keep the server's filename
+      const blob = await response.blob();
+      const disposition = response.headers.get("content-disposition");
+      const filename = disposition?.match(/filename="?([^";]+)"?/)?.[1] ?? "extracted_data.bin";
+      return new File([blob], filename, { type: blob.type });
     }
   },
 
-  async analyzeImage(file: File) {
+  async analyzeImage(file: File, mode: "full" | "triage" | "auto" = "full") {
     const formData = new FormData();
     formData.append("file", file);
+    formData.append("mode", mode);
 
     const response = await fetch(`${API_BASE_URL}/analyze`, {
       method: "POST",
@@ -72,12 +72,13 @@ const Steganalysis = () => {
         const url = URL.createObjectURL(result);
         const isImage = result.type.startsWith('image/');
         const isAudio = result.type.startsWith('audio/');
+        const isText = result.type.startsWith('text/');
         const fileType = isImage ? 'image' : isAudio ? 'audio' : 'file';
-        const extension = isImage ? 'png' : isAudio ? 'wav' : 'bin';
+        const extension = isImage ? 'png' : isAudio ? 'wav' : isText ? 'txt' : 'bin';
         
         setExtractedFile({
           url,
-          name: `extracted_data.${extension}`,
+          name: result instanceof File ? result.name : `extracted_data.${extension}`,
           type: fileType,
         });
         toast.success("Hidden file extracted successfully!");